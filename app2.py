@@ -1,400 +1,577 @@
 import streamlit as st
 import pandas as pd
+import xlsxwriter
 from io import BytesIO
 
-# --------------------------------------------------
-# Page config
-# --------------------------------------------------
-st.set_page_config(page_title="Order Analysis Dashboard", layout="wide")
-st.title("📊 Order Analysis Dashboard")
+VALUE_COLS = ["quantity", "item-price", "cost"]
+
+# Per-ASIN descriptive columns shown in the ASIN summaries
+ASIN_INFO_COLS = ["Vendor SKU", "Brand", "Brand Manager", "product-name"]
+
+# On-screen tables are capped; downloads always carry every row
+PREVIEW_ROWS = 1000
+
+# Rows in one Excel sheet, header included
+XLSX_MAX_ROWS = 1_048_576
+
+# Everything the pivots read; the other order columns are raw data only
+PIVOT_COLS = ["asin", *ASIN_INFO_COLS, "date", *VALUE_COLS]
 
 # --------------------------------------------------
-# Upload files
+# Helpers
 # --------------------------------------------------
-c1, c2 = st.columns(2)
-with c1:
-    orders_file = st.file_uploader(
-    "Upload Orders File(s) (.xlsx or .txt)",
-    type=["xlsx", "txt"],
-    accept_multiple_files=True
-)
-with c2:
-    pm_file = st.file_uploader("Upload Purchase Master File", type=["xlsx"])
+def normalize_cols(columns):
+    # str() first: numeric header cells (e.g. a year) would become NaN
+    return pd.Index([str(col).strip().lower() for col in columns])
+
+def read_xlsx(data, **kwargs):
+    # calamine is much faster than openpyxl, which stays as the fallback
+    try:
+        return pd.read_excel(
+            BytesIO(data), engine="calamine", dtype_backend="pyarrow", **kwargs
+        )
+    except ImportError:
+        return pd.read_excel(
+            BytesIO(data), engine="openpyxl", dtype_backend="pyarrow", **kwargs
+        )
+
+def to_excel_bytes(sheets):
+    # sheets: (sheet name, DataFrame, write index?, Grand Total row or None)
+    out = BytesIO()
+    with pd.ExcelWriter(
+        out,
+        engine="xlsxwriter",
+        engine_kwargs={"options": {"strings_to_urls": False}}
+    ) as writer:
+        for sheet_name, df, index, total in sheets:
+            df.to_excel(writer, sheet_name=sheet_name, index=index)
+            if total is None:
+                continue
+
+            # Grand Total goes in as one extra row under the table
+            ws = writer.sheets[sheet_name]
+            values = [*total.index] if index else []
+            ws.write_row(ws.dim_rowmax + 1, 0, values + total.iloc[0].tolist())
+    return out.getvalue()
+
+def total_row(summary, label_col):
+    # Bottom "Grand Total" row: sums under VALUE_COLS, blanks elsewhere
+    total = (
+        summary[VALUE_COLS].sum().to_frame().T
+        .reindex(columns=summary.columns, fill_value="")
+    )
+    total[label_col] = "Grand Total"
+    total.index = [len(summary)]
+
+    return total
+
+def show_preview(df, total=None, n_rows=None):
+    # n_rows: full row count when df is already just the first rows
+    rows = n_rows or len(df) + (total is not None)
+    if rows > PREVIEW_ROWS:
+        st.caption(
+            f"Showing {PREVIEW_ROWS:,} of {rows:,} rows — download for the full table"
+        )
+
+    if total is None:
+        st.dataframe(df.head(PREVIEW_ROWS), use_container_width=True)
+        return
+
+    # Grand Total stays visible under the shown rows
+    preview = pd.concat([df.head(PREVIEW_ROWS - 1), total])
+    st.dataframe(preview, use_container_width=True)
+
+def resolve_pm_cols(columns):
+    # Final Working name -> PM column position (vendor SKU / cp fall back)
+    is_bm = columns.str.contains("brand.*manager", regex=True)
+    bm = [i for i, hit in enumerate(is_bm) if hit]
+    columns = list(columns)
+    if "brand" not in columns or not bm:
+        raise ValueError(
+            "Purchase Master needs a 'Brand' and a 'Brand Manager' column"
+        )
+
+    def pick(names, position):
+        found = next((columns.index(c) for c in names if c in columns), None)
+        if found is None and len(columns) > position:
+            found = position
+        if found is None:
+            raise ValueError(f"Purchase Master has no '{names[0]}' column")
+        return found
+
+    return {
+        "Brand": columns.index("brand"),
+        "Brand Manager": bm[0],
+        "cost": pick(("cp", "cost price", "cost"), 7),
+        "Vendor SKU": pick(("vendor sku", "vendor_sku"), 3)
+    }
+
+def to_parquet_bytes(df):
+    out = BytesIO()
+    df.to_parquet(out, engine="pyarrow", compression="zstd", index=False)
+    return out.getvalue()
 
 # --------------------------------------------------
-# Generate button
+# Pipeline (cached on the uploaded bytes, so reruns skip it)
 # --------------------------------------------------
-if st.button("🚀 Generate Analysis"):
+@st.cache_data(show_spinner=False, max_entries=16)
+def load_orders_file(name, data):
+    # One upload per cache entry, so only new files are parsed
+    if name.endswith(".xlsx"):
+        df = read_xlsx(data)
+
+    elif name.endswith(".txt"):
+        df = pd.read_csv(
+            BytesIO(data),
+            sep="\t",
+            encoding="utf-8",
+            dtype="string[pyarrow]"
+        )
+    else:
+        return None
+
+    # Standardize column names immediately
+    df.columns = normalize_cols(df.columns)
+
+    return df
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_pm_lookup(data):
+    # The ready-to-join PM lookup, built once per Purchase Master upload
+
+    pm = read_xlsx(data)
+    header = normalize_cols(pm.columns)
+    if "asin" not in header:
+        raise ValueError("Purchase Master has no 'asin' column")
+    pm_cols = resolve_pm_cols(header)
+
+    # Positions, not names: a fallback may reuse a column already picked
+    pm = pm.iloc[:, [header.get_indexer(["asin"])[0], *pm_cols.values()]]
+    pm.columns = ["asin", *pm_cols]
+
+    for col in pm.select_dtypes("object").columns:
+        pm[col] = pm[col].astype("string[pyarrow]")
+
+    # PM rows without an ASIN (missing or blank) can never match an order
+    pm["asin"] = pm["asin"].astype("string[pyarrow]").str.strip()
+    pm = pm[pm["asin"].str.len().fillna(0) > 0]
+
+    # Unique ASIN index, so the join is a plain index probe
+    lookup = pm.drop_duplicates("asin").set_index("asin")
+
+    # Standardize Brand / Brand Manager and parse cost once per PM ASIN
+    for col in ("Brand", "Brand Manager"):
+        lookup[col] = (
+            lookup[col]
+            .fillna("nan")
+            .astype("string[pyarrow]")
+            .str.strip()
+            .str.title()
+        )
+    lookup["cost"] = pd.to_numeric(lookup["cost"], errors="coerce")
+
+    return lookup
+
+
+def load_and_clean(orders_uploads, pm_bytes):
+    # orders_uploads: tuple of (file name, file bytes)
 
-    if not orders_file or pm_file is None:
-        st.error("Please upload both files")
-        st.stop()
     # --------------------------------------------------
     # Load Orders File (Excel OR TXT)
     # --------------------------------------------------
     all_dataframes = []
 
-    for file in orders_file:
-        
-        if file.name.endswith(".xlsx"):
-            df = pd.read_excel(file)
-            
-        elif file.name.endswith(".txt"):
-            df = pd.read_csv(
-                file,
-                sep="\t",
-                encoding="utf-8",
-                dtype=str
-            )
-        else:
-            continue
-        
-        # Standardize column names immediately
-        df.columns = df.columns.str.strip().str.lower()
-        
-        all_dataframes.append(df)
+    for name, data in orders_uploads:
+        df = load_orders_file(name, data)
+        if df is not None:
+            all_dataframes.append(df)
 
     # 🔥 CONCAT BASED ON HEADER NAMES
     Working = pd.concat(all_dataframes, ignore_index=True, sort=False)
 
-    pm = pd.read_excel(pm_file)
-
     # --------------------------------------------------
     # Cleaning
     # --------------------------------------------------
-    Working.columns = Working.columns.str.strip().str.lower()
-    pm.columns = pm.columns.str.strip().str.lower()
+    # Arrow-backed strings: the .str calls below run as Arrow kernels
+    for col in Working.select_dtypes("object").columns:
+        Working[col] = Working[col].astype("string[pyarrow]")
 
-    Working["date"] = pd.to_datetime(Working["purchase-date"]).dt.date
-    Working["asin"] = Working["asin"].astype(str).str.strip()
-    pm["asin"] = pm["asin"].astype(str).str.strip()
+    # --------------------------------------------------
+    # FORCE NUMERIC COLUMNS (VERY IMPORTANT)
+    # --------------------------------------------------
+    for col in ("quantity", "item-price"):
+        Working[col] = pd.to_numeric(Working[col], errors="coerce").fillna(0)
 
-    pm_unique = pm.drop_duplicates("asin")
+    # NumPy value columns; quantity downcast, prices stay float64
+    Working["quantity"] = pd.to_numeric(
+        Working["quantity"].to_numpy(dtype="float64"), downcast="integer"
+    )
+    Working["item-price"] = Working["item-price"].astype("float64")
 
     # --------------------------------------------------
-    # Mapping
+    # Filters
     # --------------------------------------------------
-    bm_col = [c for c in pm.columns if "brand" in c and "manager" in c][0]
-    
-    Working["Brand"] = Working["asin"].map(pm_unique.set_index("asin")["brand"])
-    Working["Brand Manager"] = Working["asin"].map(
-        pm_unique.set_index("asin")[bm_col]
+    # One fused mask; a missing item-status is not "Cancelled"
+    mask = (
+        Working["quantity"].ne(0) &
+        Working["item-price"].ne(0) &
+        Working["item-status"].ne("Cancelled").fillna(True)
     )
+    Working = Working.loc[mask]
+
+    # Local order day from the leading YYYY-MM-DD (offsets change with DST)
+    purchase = Working["purchase-date"]
+    if pd.api.types.is_string_dtype(purchase):
+        purchase = pd.to_datetime(
+            purchase.str.slice(0, 10), format="%Y-%m-%d", errors="coerce"
+        )
+    Working["date"] = pd.to_datetime(purchase, errors="coerce").dt.floor("D")
+    Working["asin"] = Working["asin"].astype("string[pyarrow]").str.strip()
+
     # --------------------------------------------------
-    # Standardize Brand / Brand Manager text
+    # Mapping
     # --------------------------------------------------
-    Working["Brand"] = (
-        Working["Brand"]
-        .astype(str)
-        .str.strip()
-        .str.title()
-    )
-    
-    Working["Brand Manager"] = (
-        Working["Brand Manager"]
-        .astype(str)
-        .str.strip()
-        .str.title()
+    # One left join does all four PM lookups
+    lookup = load_pm_lookup(pm_bytes)
+
+    Working = Working.join(lookup, on="asin")
+
+    # Unmapped ASINs keep the "Nan" label and a zero cost
+    Working[["Brand", "Brand Manager"]] = (
+        Working[["Brand", "Brand Manager"]].fillna("Nan")
     )
+    Working["cost"] = Working["cost"].fillna(0).astype("float64")
 
-    Working["cost"] = pd.to_numeric(
-        Working["asin"].map(pm_unique.set_index("asin")["cp"]),
-        errors="coerce"
-    ).fillna(0)
-    
-    vendor_sku_col = pm_unique.columns[3]  # Excel column 4
+    # Repetitive text as categories, so the pivots group on integer codes
+    for col in ("asin", "Brand", "Brand Manager", "product-name", "item-status"):
+        Working[col] = Working[col].astype("category")
 
-    Working["Vendor SKU"] = Working["asin"].map(
-        pm_unique.set_index("asin")[vendor_sku_col]
+    return Working
+
+
+def base_totals(Working):
+    # Orders rolled up to (Brand Manager, Brand, date); NaT dates carry on
+    # into the pivots' "NaT" column and the tab 5 totals
+    return (
+        Working
+        .groupby(
+            ["Brand Manager", "Brand", "date"], observed=True, dropna=False
+        )[VALUE_COLS]
+        .sum()
     )
-    
-    # --------------------------------------------------
-    # FORCE NUMERIC COLUMNS (VERY IMPORTANT)
-    # --------------------------------------------------
-    num_cols = ["quantity", "item-price", "cost"]
 
-    for col in num_cols:
-        Working[col] = pd.to_numeric(Working[col], errors="coerce").fillna(0)
 
+def date_pivot(base, index_col):
+    # Date-wise pivot with right side and bottom grand totals (tabs 1 & 2);
+    # missing dates keep their own "NaT" column
+    pivot = (
+        base
+        .groupby(level=[index_col, "date"], observed=True, dropna=False)
+        .sum()
+        .unstack("date", fill_value=0)
+    )
 
-    # --------------------------------------------------
-    # Filters
-    # --------------------------------------------------
-    Working = Working[
-        (Working["quantity"] != 0) &
-        (Working["item-price"] != 0) &
-        (Working["item-status"] != "Cancelled")
+    # Dates come out of the groupby in order, so no axis sort is needed
+    dates = pivot.columns.get_level_values("date").unique()
+    metrics = sorted(VALUE_COLS)
+    pivot = pivot.swaplevel(0, 1, axis=1)[
+        pd.MultiIndex.from_product([dates, metrics])
     ]
-    
-    Working[num_cols] = Working[num_cols].fillna(0)
-
-    for col in Working.columns:
-        if Working[col].dtype == "object":
-            Working[col] = Working[col].astype(str)
-            
-    # --------------------------------------------------
-    # Tabs
-    # --------------------------------------------------
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-        "Brand Manager Analysis",
-        "Brand Analysis",
-        "Brand & ASIN Summary",
-        "BM / Brand / ASIN Summary",
-        "📊 Summary Pivots",
-        "🧾 Raw Data"
+    # Labels are built once per date / metric, not formatted per column
+    pivot.columns = pd.MultiIndex.from_product([
+        dates.strftime("%Y-%m-%d").fillna("NaT"),
+        [f"Sum of {col}" for col in metrics]
     ])
 
-    # ==================================================
-    # TAB 1 – BRAND MANAGER ANALYSIS (DATE WISE + GRAND TOTAL)
-    # ==================================================
-    with tab1:
-        pivot_bm = pd.pivot_table(
-            Working,
-            index="Brand Manager",
-            columns="date",
-            values=["quantity", "item-price", "cost"],
-            aggfunc="sum",
-            fill_value=0
+    # 🔥 RIGHT SIDE GRAND TOTAL (ROW-WISE, DATE BASED)
+    for col in VALUE_COLS:
+        pivot[("Grand Total", f"Total Sum of {col}")] = (
+            pivot.loc[:, pd.IndexSlice[:, f"Sum of {col}"]].sum(axis=1)
         )
 
-        pivot_bm = pivot_bm.swaplevel(0, 1, axis=1).sort_index(axis=1, level=0)
-        pivot_bm.columns = pivot_bm.columns.map(
-            lambda x: (x[0], f"Sum of {x[1]}")
-        )
+    # Unnamed index keeps the sheet layout the Grand Total concat used to give
+    pivot.index.name = None
 
-        # 🔥 RIGHT SIDE GRAND TOTAL (ROW-WISE, DATE BASED)
-        pivot_bm[("Grand Total", "Total Sum of quantity")] = (
-            pivot_bm.loc[:, pd.IndexSlice[:, "Sum of quantity"]].sum(axis=1)
-        )
-        pivot_bm[("Grand Total", "Total Sum of item-price")] = (
-            pivot_bm.loc[:, pd.IndexSlice[:, "Sum of item-price"]].sum(axis=1)
-        )
-        pivot_bm[("Grand Total", "Total Sum of cost")] = (
-            pivot_bm.loc[:, pd.IndexSlice[:, "Sum of cost"]].sum(axis=1)
+    # 🔥 BOTTOM GRAND TOTAL ROW (returned separately, never concatenated)
+    grand_row = pivot.sum(axis=0).to_frame("Grand Total").T
+
+    return pivot, grand_row
+
+
+def asin_totals(Working):
+    # Single pass over the orders; tabs 3 and 4 are column subsets of this
+    return (
+        Working
+        .groupby("asin", as_index=False, observed=True, dropna=False)
+        .agg({
+            **{col: "first" for col in ASIN_INFO_COLS},
+            **{col: "sum" for col in VALUE_COLS}
+        })
+        .sort_values(
+            "quantity", ascending=False, kind="stable", ignore_index=True
         )
-        
+    )
 
-        # 🔥 BOTTOM GRAND TOTAL ROW
-        grand_row = pivot_bm.sum(axis=0).to_frame().T
-        grand_row.index = ["Grand Total"]
 
-        pivot_bm_final = pd.concat([pivot_bm, grand_row])
+def asin_summary(totals, first_cols):
+    # ASIN level totals sorted by quantity, grand total at the bottom (tabs 3 & 4)
+    summary = totals[["asin", *first_cols, *VALUE_COLS]]
 
-        st.dataframe(pivot_bm_final, use_container_width=True)
+    return summary, total_row(summary, "asin")
 
-        out = BytesIO()
-        with pd.ExcelWriter(out, engine="openpyxl") as writer:
-            pivot_bm_final.to_excel(writer)
-        out.seek(0)
 
-        st.download_button(
-            "📥 Download Brand Manager Analysis",
-            out,
-            "brand_manager_analysis.xlsx"
-        )
+def bm_brand_totals(base):
+    # Both tab 5 summaries roll up from this
+    return base.groupby(level=["Brand Manager", "Brand"], observed=True).sum()
 
-    # ==================================================
-    # TAB 2 – BRAND ANALYSIS (DATE WISE + GRAND TOTAL)
-    # ==================================================
-    with tab2:
-        pivot_brand = pd.pivot_table(
-            Working,
-            index="Brand",
-            columns="date",
-            values=["quantity", "item-price", "cost"],
-            aggfunc="sum",
-            fill_value=0
-        )
 
-        pivot_brand = pivot_brand.swaplevel(0, 1, axis=1).sort_index(axis=1, level=0)
-        pivot_brand.columns = pivot_brand.columns.map(
-            lambda x: (x[0], f"Sum of {x[1]}")
-        )
+def group_summary(totals, key):
+    # One row per Brand / Brand Manager, grand total at the bottom (tab 5)
+    summary = (
+        totals
+        .groupby(level=key, observed=True)
+        .sum()
+        .sort_values("quantity", ascending=False)
+        .reset_index()
+    )
 
-        pivot_brand[("Grand Total", "Total Sum of quantity")] = (
-            pivot_brand.loc[:, pd.IndexSlice[:, "Sum of quantity"]].sum(axis=1)
-        )
-        pivot_brand[("Grand Total", "Total Sum of item-price")] = (
-            pivot_brand.loc[:, pd.IndexSlice[:, "Sum of item-price"]].sum(axis=1)
-        )
-        
-        pivot_brand[("Grand Total", "Total Sum of cost")] = (
-            pivot_brand.loc[:, pd.IndexSlice[:, "Sum of cost"]].sum(axis=1)
+    return summary, total_row(summary, key)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def raw_xlsx_bytes(orders_uploads, pm_bytes):
+    # Built on request only; xlsxwriter rows, constant_memory keeps memory flat
+    Working = load_and_clean(orders_uploads, pm_bytes)
+
+    # Past the sheet limit write_row just returns -1, so refuse up front
+    if len(Working) >= XLSX_MAX_ROWS:
+        raise ValueError(
+            f"{len(Working):,} rows do not fit in one Excel sheet; "
+            "use the Parquet download instead"
         )
-        
-        
-        grand_row = pivot_brand.sum(axis=0).to_frame().T
-        grand_row.index = ["Grand Total"]
 
-        pivot_brand_final = pd.concat([pivot_brand, grand_row])
+    out = BytesIO()
+    workbook = xlsxwriter.Workbook(out, {
+        "constant_memory": True,
+        "strings_to_urls": False,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss"
+    })
+    ws = workbook.add_worksheet("Raw Data")
+
+    # Same header look as to_excel
+    header = workbook.add_format(
+        {"bold": True, "border": 1, "align": "center", "valign": "top"}
+    )
+    ws.write_row(0, 0, list(Working.columns), header)
 
-        st.dataframe(pivot_brand_final, use_container_width=True)
+    # NA of any dtype becomes None, i.e. an empty cell
+    columns = [
+        Working[col].astype(object).where(Working[col].notna(), None).tolist()
+        for col in Working.columns
+    ]
+    # Only the derived order day drops the time of day
+    day = workbook.add_format({"num_format": "yyyy-mm-dd"})
+    day_col = Working.columns.get_loc("date")
+    for row_num, row in enumerate(zip(*columns), start=1):
+        ws.write_row(row_num, 0, row)
+        ws.write(row_num, day_col, row[day_col], day)
+
+    workbook.close()
+    return out.getvalue()
+
+
+def report_xlsx_bytes(
+    pivot_bm,
+    pivot_brand,
+    brand_asin,
+    bm_brand_asin,
+    brand_summary,
+    bm_summary
+):
+    # Every report in one workbook; each argument is a (report, total) pair
+    sheets = [
+        ("Brand Manager Analysis", pivot_bm, True),
+        ("Brand Analysis", pivot_brand, True),
+        ("Brand & ASIN Summary", brand_asin, False),
+        ("BM Brand ASIN Summary", bm_brand_asin, False),
+        ("Brand Summary", brand_summary, False),
+        ("BM Summary", bm_summary, False)
+    ]
+    return to_excel_bytes([
+        (name, report, index, total)
+        for name, (report, total), index in sheets
+    ])
 
-        out = BytesIO()
-        with pd.ExcelWriter(out, engine="openpyxl") as writer:
-            pivot_brand_final.to_excel(writer)
-        out.seek(0)
 
-        st.download_button(
-            "📥 Download Brand Analysis",
-            out,
-            "brand_analysis.xlsx"
-        )
+@st.cache_data(show_spinner=False, max_entries=4)
+def run_pipeline(orders_uploads, pm_bytes):
+    # Everything the page shows, cached on the uploaded bytes
+    Working = load_and_clean(orders_uploads, pm_bytes)
+
+    # Slim projection for the pivots: smaller scans
+    W = Working[PIVOT_COLS]
+
+    base = base_totals(W)
+    asin_level = asin_totals(W)
+    totals = bm_brand_totals(base)
+
+    reports = {
+        "pivot_bm": date_pivot(base, "Brand Manager"),
+        "pivot_brand": date_pivot(base, "Brand"),
+        "brand_asin": asin_summary(
+            asin_level, ("Vendor SKU", "Brand", "product-name")
+        ),
+        "bm_brand_asin": asin_summary(
+            asin_level, ("Vendor SKU", "Brand", "Brand Manager", "product-name")
+        ),
+        "brand_summary": group_summary(totals, "Brand"),
+        "bm_summary": group_summary(totals, "Brand Manager")
+    }
+
+    return {
+        "raw_preview": Working.head(PREVIEW_ROWS),
+        "raw_rows": len(Working),
+        **reports,
+        "report_xlsx": report_xlsx_bytes(**reports),
+        "raw_parquet": to_parquet_bytes(Working)
+    }
 
-    # ==================================================
-    # TAB 3 – BRAND & ASIN SUMMARY (SORT + GRAND TOTAL BOTTOM)
-    # ==================================================
-    with tab3:
-        brand_asin = (
-            Working
-            .groupby("asin", as_index=False)
-            .agg({
-                "Vendor SKU": "first",
-                "Brand": "first",
-                "product-name": "first",
-                "quantity": "sum",
-                "item-price": "sum",
-                "cost": "sum"
-            })
-            .sort_values("quantity", ascending=False)
-        )
+# --------------------------------------------------
+# Raw data tab (a fragment: its button reruns just this tab, not the page)
+# --------------------------------------------------
+@st.fragment
+def raw_data_tab(results, uploads, pm_bytes):
+    show_preview(results["raw_preview"], n_rows=results["raw_rows"])
+
+    # 📥 DOWNLOAD RAW DATA (Parquet: written in milliseconds)
+    st.download_button(
+        "📥 Download Raw Data",
+        results["raw_parquet"],
+        "raw_data.parquet",
+        mime="application/octet-stream"
+    )
 
-        total_row = brand_asin[["quantity", "item-price", "cost"]].sum().to_frame().T
-        total_row.insert(0, "asin", "Grand Total")
-        total_row.insert(1, "Vendor SKU", "")
-        total_row.insert(2, "Brand", "")
-        total_row.insert(3, "product-name", "")
+    # The raw XLSX is slow to build, so only on request
+    if st.button("Also generate XLSX"):
+        st.session_state["raw_xlsx"] = True
 
-        brand_asin_final = pd.concat([brand_asin, total_row], ignore_index=True)
+    if st.session_state.get("raw_xlsx"):
+        try:
+            raw_xlsx = raw_xlsx_bytes(uploads, pm_bytes)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.download_button(
+                "📥 Download Raw Data (XLSX)",
+                raw_xlsx,
+                "raw_data.xlsx"
+            )
 
-        st.dataframe(brand_asin_final, use_container_width=True)
+# --------------------------------------------------
+# Page config
+# --------------------------------------------------
+st.set_page_config(page_title="Order Analysis Dashboard", layout="wide")
+st.title("📊 Order Analysis Dashboard")
 
-        out = BytesIO()
-        with pd.ExcelWriter(out, engine="openpyxl") as writer:
-            brand_asin_final.to_excel(writer, index=False)
-        out.seek(0)
+# --------------------------------------------------
+# Upload files
+# --------------------------------------------------
+c1, c2 = st.columns(2)
+with c1:
+    orders_file = st.file_uploader(
+    "Upload Orders File(s) (.xlsx or .txt)",
+    type=["xlsx", "txt"],
+    accept_multiple_files=True
+)
+with c2:
+    pm_file = st.file_uploader("Upload Purchase Master File", type=["xlsx"])
 
-        st.download_button(
-            "📥 Download Brand & ASIN Summary",
-            out,
-            "brand_asin_summary.xlsx"
-        )
+# Bytes are hashable, so identical uploads hit the cache
+uploads = tuple((file.name, file.getvalue()) for file in orders_file or [])
+pm_bytes = pm_file.getvalue() if pm_file is not None else None
 
-    # ==================================================
-    # TAB 4 – BM / BRAND / ASIN SUMMARY
-    # ==================================================
-    with tab4:
+# A changed upload waits for a fresh Generate click
+upload_key = (hash(uploads), hash(pm_bytes))
+if st.session_state.get("upload_key") != upload_key:
+    st.session_state["upload_key"] = upload_key
+    st.session_state["generated"] = False
+    st.session_state["raw_xlsx"] = False
 
-        bm_brand_asin = (
-            Working
-            .groupby("asin", as_index=False)
-            .agg({
-                "Vendor SKU": "first",
-                "Brand": "first",
-                "Brand Manager": "first",
-                "product-name": "first",
-                "quantity": "sum",
-                "item-price": "sum",
-                "cost": "sum"
-            })
-            .sort_values("quantity", ascending=False)
-        )
+# --------------------------------------------------
+# Generate button
+# --------------------------------------------------
+if st.button("🚀 Generate Analysis"):
 
-        total_row = bm_brand_asin[["quantity", "item-price", "cost"]].sum().to_frame().T
-        total_row.insert(0, "asin", "Grand Total")
-        total_row.insert(1, "Vendor SKU", "")
-        total_row.insert(2, "Brand", "")
-        total_row.insert(3, "Brand Manager", "")
-        total_row.insert(4, "product-name", "")
+    if not orders_file or pm_file is None:
+        st.error("Please upload both files")
+        st.stop()
 
-        bm_brand_asin_final = pd.concat(
-            [bm_brand_asin, total_row], ignore_index=True
-        )
+    # Remembered so reruns from the buttons below keep the reports up
+    st.session_state["generated"] = True
+    st.session_state["raw_xlsx"] = False
 
-        st.dataframe(bm_brand_asin_final, use_container_width=True)
+if st.session_state.get("generated") and orders_file and pm_file is not None:
 
-        out = BytesIO()
-        with pd.ExcelWriter(out, engine="openpyxl") as writer:
-            bm_brand_asin_final.to_excel(writer, index=False)
-        out.seek(0)
+    try:
+        results = run_pipeline(uploads, pm_bytes)
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
 
-        st.download_button(
-            "📥 Download BM / Brand / ASIN Summary",
-            out,
-            "bm_brand_asin_summary.xlsx"
-        )
+    # 📥 DOWNLOAD ALL REPORTS (one sheet per tab, serialized once)
+    st.download_button(
+        "📥 Download Full Report",
+        results["report_xlsx"],
+        "order_analysis_report.xlsx"
+    )
+
+    # --------------------------------------------------
+    # Tabs
+    # --------------------------------------------------
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+        "Brand Manager Analysis",
+        "Brand Analysis",
+        "Brand & ASIN Summary",
+        "BM / Brand / ASIN Summary",
+        "📊 Summary Pivots",
+        "🧾 Raw Data"
+    ])
 
     # ==================================================
-    # TAB 5 – SUMMARY PIVOTS
+    # TAB 1 – BRAND MANAGER ANALYSIS (DATE WISE + GRAND TOTAL)
     # ==================================================
-    with tab5:
-        brand_summary = (
-            Working
-            .groupby("Brand")[["quantity", "item-price", "cost"]]
-            .sum()
-            .reset_index()
-            .sort_values("quantity", ascending=False)
-        )
+    with tab1:
+        show_preview(*results["pivot_bm"])
 
-        brand_total = brand_summary[["quantity", "item-price", "cost"]].sum().to_frame().T
-        brand_total.insert(0, "Brand", "Grand Total")
-
-        brand_summary_final = pd.concat([brand_summary, brand_total], ignore_index=True)
-        st.dataframe(brand_summary_final, use_container_width=True)
-        
-        out = BytesIO()
-        with pd.ExcelWriter(out, engine="openpyxl") as writer:
-            brand_summary_final.to_excel(writer, sheet_name="Brand Summary", index=False)
-        out.seek(0)
-
-        st.download_button(
-            "📥 Download Brand Report",
-            out,
-            "Brand_report.xlsx"
-        )
+    # ==================================================
+    # TAB 2 – BRAND ANALYSIS (DATE WISE + GRAND TOTAL)
+    # ==================================================
+    with tab2:
+        show_preview(*results["pivot_brand"])
 
-        bm_summary = (
-            Working
-            .groupby("Brand Manager")[["quantity", "item-price", "cost"]]
-            .sum()
-            .reset_index()
-            .sort_values("quantity", ascending=False)
-        )
+    # ==================================================
+    # TAB 3 – BRAND & ASIN SUMMARY (SORT + GRAND TOTAL BOTTOM)
+    # ==================================================
+    with tab3:
+        show_preview(*results["brand_asin"])
 
-        bm_total = bm_summary[["quantity", "item-price", "cost"]].sum().to_frame().T
-        bm_total.insert(0, "Brand Manager", "Grand Total")
-
-        bm_summary_final = pd.concat([bm_summary, bm_total], ignore_index=True)
-        st.dataframe(bm_summary_final, use_container_width=True)
-        
-        # 📥 DOWNLOAD SUMMARY REPORT
-        out = BytesIO()
-        with pd.ExcelWriter(out, engine="openpyxl") as writer:
-            bm_summary_final.to_excel(writer, sheet_name="BM Summary", index=False)
-        out.seek(0)
-
-        st.download_button(
-            "📥 Download Brand Manager Report",
-            out,
-            "Brand_Manager_report.xlsx"
-        )
+    # ==================================================
+    # TAB 4 – BM / BRAND / ASIN SUMMARY
+    # ==================================================
+    with tab4:
+        show_preview(*results["bm_brand_asin"])
+
+    # ==================================================
+    # TAB 5 – SUMMARY PIVOTS
+    # ==================================================
+    with tab5:
+        show_preview(*results["brand_summary"])
+        show_preview(*results["bm_summary"])
 
     # ==================================================
     # TAB 6 – RAW DATA
     # ==================================================
     with tab6:
-        st.dataframe(Working, use_container_width=True)
-     
-        # 📥 DOWNLOAD RAW DATA
-        out = BytesIO()
-        with pd.ExcelWriter(out, engine="openpyxl") as writer:
-            Working.to_excel(writer, index=False, sheet_name="Raw Data")
-        out.seek(0)
-
-        st.download_button(
-            "📥 Download Raw Data",
-            out,
-            "raw_data.xlsx"
-        )
+        raw_data_tab(results, uploads, pm_bytes)
 
     st.success("✅ All reports generated correctly (date-wise & grand totals fixed)")